@@ -1,21 +1,36 @@
 from flask import Flask, jsonify, request
 from flask_cors import CORS
-import requests, os, json
+import requests, os, json, re
 from dotenv import load_dotenv
-from cache import get_with_stale_while_revalidate, init_db
-from config import get_ttl
+from cache import get_with_stale_while_revalidate, init_db, get_cache_outcome, reset_cache_outcome, load_snapshot_once, save_stale_cache, get_derived_with_stale_while_revalidate
+from config import get_ttl, CHANGES_POLL_INTERVAL
+from changes import ChangesPoller
+from projection import parse_fields, project, projected_key
+from traffic import init_traffic_recording
 
 load_dotenv()
 
 app = Flask(__name__)
 CORS(app)
 TMDB_KEY = os.environ.get("TMDB_KEY")
+# Overridable so the app can be pointed at a local stub (see tmdb_stub.py)
+TMDB_API_BASE = os.environ.get("TMDB_API_BASE", "https://api.themoviedb.org/3").rstrip("/")
 init_db()
+init_traffic_recording(app)
+
+# Warm the cache from a snapshot before serving (Render's disk starts empty on each deploy)
+CACHE_SNAPSHOT_FILE = os.environ.get("CACHE_SNAPSHOT_FILE")
+if CACHE_SNAPSHOT_FILE and os.path.exists(CACHE_SNAPSHOT_FILE):
+    try:
+        # Once per boot: with several gunicorn workers the first one loads it
+        load_snapshot_once(CACHE_SNAPSHOT_FILE)
+    except Exception as e:
+        print(f"[SWR CACHE] Failed to load snapshot '{CACHE_SNAPSHOT_FILE}': {e}", flush=True)
 
 def fetch_popular_movies(page=1):
     """Fetch popular movies from TMDB API"""
     res = requests.get(
-        "https://api.themoviedb.org/3/movie/popular",
+        f"{TMDB_API_BASE}/movie/popular",
         headers={"Authorization": f"Bearer {TMDB_KEY}"},
         params={"page": page}
     )
@@ -26,7 +41,7 @@ def fetch_popular_movies(page=1):
 def fetch_now_playing_movies(page=1):
     """Fetch now playing movies from TMDB API"""
     res = requests.get(
-        "https://api.themoviedb.org/3/movie/now_playing",
+        f"{TMDB_API_BASE}/movie/now_playing",
         headers={"Authorization": f"Bearer {TMDB_KEY}"},
         params={"page": page}
     )
@@ -37,7 +52,7 @@ def fetch_now_playing_movies(page=1):
 def fetch_upcoming_movies(page=1):
     """Fetch upcoming movies from TMDB API"""
     res = requests.get(
-        "https://api.themoviedb.org/3/movie/upcoming",
+        f"{TMDB_API_BASE}/movie/upcoming",
         headers={"Authorization": f"Bearer {TMDB_KEY}"},
         params={"page": page}
     )
@@ -48,7 +63,7 @@ def fetch_upcoming_movies(page=1):
 def fetch_trending_movies(page=1):
     """Fetch trending movies from TMDB API"""
     res = requests.get(
-        "https://api.themoviedb.org/3/trending/movie/week",
+        f"{TMDB_API_BASE}/trending/movie/week",
         headers={"Authorization": f"Bearer {TMDB_KEY}"},
         params={"page": page}
     )
@@ -58,7 +73,7 @@ def fetch_trending_movies(page=1):
 
 def fetch_movie_search(query, page=1):
     """Fetch movie search results from TMDB API"""
-    url = "https://api.themoviedb.org/3/search/movie"
+    url = f"{TMDB_API_BASE}/search/movie"
     headers = {"Authorization": f"Bearer {TMDB_KEY}"}
     params = {"query": query, "page": page}
     
@@ -69,7 +84,7 @@ def fetch_movie_search(query, page=1):
 
 def fetch_tv_search(query):
     """Fetch TV search results from TMDB API"""
-    url = "https://api.themoviedb.org/3/search/tv"
+    url = f"{TMDB_API_BASE}/search/tv"
     headers = {"Authorization": f"Bearer {TMDB_KEY}"}
     params = {"query": query}
     
@@ -84,7 +99,7 @@ def fetch_movie_detail(movie_id):
 
     # Get movie details
     detail_res = requests.get(
-        f"https://api.themoviedb.org/3/movie/{movie_id}",
+        f"{TMDB_API_BASE}/movie/{movie_id}",
         headers=headers
     )
     if detail_res.status_code != 200:
@@ -93,7 +108,7 @@ def fetch_movie_detail(movie_id):
 
     # Get images
     images_res = requests.get(
-        f"https://api.themoviedb.org/3/movie/{movie_id}/images",
+        f"{TMDB_API_BASE}/movie/{movie_id}/images",
         headers=headers
     )
     if images_res.status_code == 200:
@@ -106,7 +121,7 @@ def fetch_movie_detail(movie_id):
 
     # Get credits
     credits_res = requests.get(
-        f"https://api.themoviedb.org/3/movie/{movie_id}/credits",
+        f"{TMDB_API_BASE}/movie/{movie_id}/credits",
         headers=headers
     )
     if credits_res.status_code == 200:
@@ -120,7 +135,7 @@ def fetch_movie_detail(movie_id):
 
     # Get videos (trailers, teasers, etc.)
     videos_res = requests.get(
-        f"https://api.themoviedb.org/3/movie/{movie_id}/videos",
+        f"{TMDB_API_BASE}/movie/{movie_id}/videos",
         headers=headers
     )
     youtube_videos = []
@@ -152,7 +167,7 @@ def fetch_movie_detail(movie_id):
     streaming_providers = {}
     try:
         providers_res = requests.get(
-            f"https://api.themoviedb.org/3/movie/{movie_id}/watch/providers",
+            f"{TMDB_API_BASE}/movie/{movie_id}/watch/providers",
             headers=headers
         )
         print(f"Streaming providers API status: {providers_res.status_code}")
@@ -239,7 +254,7 @@ def fetch_movie_detail(movie_id):
 
 def fetch_movie_images(movie_id):
     """Fetch movie images from TMDB API"""
-    url = f"https://api.themoviedb.org/3/movie/{movie_id}/images"
+    url = f"{TMDB_API_BASE}/movie/{movie_id}/images"
     headers = {"Authorization": f"Bearer {TMDB_KEY}"}
 
     res = requests.get(url, headers=headers)
@@ -264,7 +279,7 @@ def fetch_actor_detail(person_id):
     
     # Get actor details
     detail_res = requests.get(
-        f"https://api.themoviedb.org/3/person/{person_id}",
+        f"{TMDB_API_BASE}/person/{person_id}",
         headers=headers
     )
     if detail_res.status_code != 200:
@@ -273,7 +288,7 @@ def fetch_actor_detail(person_id):
 
     # Get movie credits
     credits_res = requests.get(
-        f"https://api.themoviedb.org/3/person/{person_id}/movie_credits",
+        f"{TMDB_API_BASE}/person/{person_id}/movie_credits",
         headers=headers
     )
     movies = []
@@ -311,7 +326,7 @@ def fetch_movie_reviews(movie_id, page=1):
     params = {"page": page}
     
     res = requests.get(
-        f"https://api.themoviedb.org/3/movie/{movie_id}/reviews",
+        f"{TMDB_API_BASE}/movie/{movie_id}/reviews",
         headers=headers,
         params=params
     )
@@ -319,6 +334,71 @@ def fetch_movie_reviews(movie_id, page=1):
         return res.json()
     return None
 
+# Refetchers for keys invalidated by the changes feed (see changes.py)
+REWARMERS = [
+    (re.compile(r"movie_detail_(\d+)$"), lambda m: fetch_movie_detail(int(m[1]))),
+    (re.compile(r"movie_images_(\d+)$"), lambda m: fetch_movie_images(int(m[1]))),
+    (re.compile(r"movie_reviews_(\d+)_page_(\d+)$"), lambda m: fetch_movie_reviews(int(m[1]), int(m[2]))),
+    (re.compile(r"actor_detail_(\d+)$"), lambda m: fetch_actor_detail(int(m[1]))),
+]
+
+def rewarm_cache_key(key):
+    """Refetch a cache entry right after the changes feed marked it stale"""
+    for pattern, fetch in REWARMERS:
+        match = pattern.match(key)
+        if match:
+            data = fetch(match)
+            if data:
+                save_stale_cache(key, data)
+            return
+
+if CHANGES_POLL_INTERVAL > 0:
+    rewarm = rewarm_cache_key if os.environ.get("TMDB_CHANGES_REWARM") == "1" else None
+    ChangesPoller(TMDB_API_BASE, TMDB_KEY, CHANGES_POLL_INTERVAL, rewarm).start()
+
+
+def requested_fields(resource):
+    """(fields, profile) asked for with ?fields= or ?profile=, see projection.parse_fields"""
+    return parse_fields(request.args.get("fields"), request.args.get("profile"), resource)
+
+def get_projected(key, ttl_seconds, fetch_function, fields, profile):
+    """
+    Stale-while-revalidate lookup of a projected variant of a cached payload
+    
+    Named profiles are cached under their own key so the projection runs
+    once per refresh instead of on every hit; the variant keeps the timestamp
+    of the full entry it was built from. Ad-hoc field lists are projected from
+    the full entry on every request.
+    """
+    if fields is None:
+        return get_with_stale_while_revalidate(key, ttl_seconds, fetch_function)
+    if profile is None:
+        data, is_cached = get_with_stale_while_revalidate(key, ttl_seconds, fetch_function)
+        return project(data, fields), is_cached
+    
+    return get_derived_with_stale_while_revalidate(
+        key=key,
+        derived_key=projected_key(key, profile),
+        ttl_seconds=ttl_seconds,
+        fetch_function=fetch_function,
+        derive=lambda data: project(data, fields)
+    )
+
+
+@app.before_request
+def reset_request_cache_outcome():
+    reset_cache_outcome()
+
+
+@app.after_request
+def add_cache_header(response):
+    """Expose the SWR outcome (MISS, HIT or STALE) to clients and replay.py"""
+    outcome = get_cache_outcome()
+    if outcome:
+        response.headers["X-Cache"] = outcome
+    return response
+
+
 @app.route("/popular")
 def popular():
     page = request.args.get("page", 1, type=int)
@@ -327,13 +407,20 @@ def popular():
     if page < 1:
         return {"error": "Page must be greater than 0"}, 400
     
-    data, is_cached = get_with_stale_while_revalidate(
+    try:
+        fields, profile = requested_fields("movie_list")
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    
+    data, is_cached = get_projected(
         key=f"popular_page_{page}",
         ttl_seconds=get_ttl("list", "popular"),
-        fetch_function=lambda: fetch_popular_movies(page)
+        fetch_function=lambda: fetch_popular_movies(page),
+        fields=fields,
+        profile=profile
     )
     
-    if data:
+    if data is not None:
         return jsonify(data)
     else:
         return {"error": "Failed to fetch popular movies"}, 500
@@ -347,13 +434,20 @@ def now_playing():
     if page < 1:
         return {"error": "Page must be greater than 0"}, 400
     
-    data, is_cached = get_with_stale_while_revalidate(
+    try:
+        fields, profile = requested_fields("movie_list")
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    
+    data, is_cached = get_projected(
         key=f"now_playing_page_{page}",
         ttl_seconds=get_ttl("list", "now_playing"),
-        fetch_function=lambda: fetch_now_playing_movies(page)
+        fetch_function=lambda: fetch_now_playing_movies(page),
+        fields=fields,
+        profile=profile
     )
     
-    if data:
+    if data is not None:
         return jsonify(data)
     else:
         return {"error": "Failed to fetch now playing movies"}, 500
@@ -367,13 +461,20 @@ def upcoming():
     if page < 1:
         return {"error": "Page must be greater than 0"}, 400
     
-    data, is_cached = get_with_stale_while_revalidate(
+    try:
+        fields, profile = requested_fields("movie_list")
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    
+    data, is_cached = get_projected(
         key=f"upcoming_page_{page}",
         ttl_seconds=get_ttl("list", "upcoming"),
-        fetch_function=lambda: fetch_upcoming_movies(page)
+        fetch_function=lambda: fetch_upcoming_movies(page),
+        fields=fields,
+        profile=profile
     )
     
-    if data:
+    if data is not None:
         return jsonify(data)
     else:
         return {"error": "Failed to fetch upcoming movies"}, 500
@@ -387,13 +488,20 @@ def trending():
     if page < 1:
         return {"error": "Page must be greater than 0"}, 400
     
-    data, is_cached = get_with_stale_while_revalidate(
+    try:
+        fields, profile = requested_fields("movie_list")
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    
+    data, is_cached = get_projected(
         key=f"trending_page_{page}",
         ttl_seconds=get_ttl("list", "trending"),
-        fetch_function=lambda: fetch_trending_movies(page)
+        fetch_function=lambda: fetch_trending_movies(page),
+        fields=fields,
+        profile=profile
     )
     
-    if data:
+    if data is not None:
         return jsonify(data)
     else:
         return {"error": "Failed to fetch trending movies"}, 500
@@ -411,13 +519,20 @@ def search_movie():
     if page < 1:
         return {"error": "Page must be greater than 0"}, 400
 
-    data, is_cached = get_with_stale_while_revalidate(
+    try:
+        fields, profile = requested_fields("movie_list")
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    
+    data, is_cached = get_projected(
         key=f"movie_search_{query}_page_{page}",
         ttl_seconds=get_ttl("search", "movie_search"),
-        fetch_function=lambda: fetch_movie_search(query, page)
+        fetch_function=lambda: fetch_movie_search(query, page),
+        fields=fields,
+        profile=profile
     )
     
-    if data:
+    if data is not None:
         return jsonify(data)
     else:
         return {"error": "Failed to search movies"}, 500
@@ -429,13 +544,20 @@ def search_tv():
     if not query:
         return {"error": "Missing 'q' parameter"}, 400
 
-    data, is_cached = get_with_stale_while_revalidate(
+    try:
+        fields, profile = requested_fields("tv_list")
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    
+    data, is_cached = get_projected(
         key=f"tv_search_{query}",
         ttl_seconds=get_ttl("search", "tv_search"),
-        fetch_function=lambda: fetch_tv_search(query)
+        fetch_function=lambda: fetch_tv_search(query),
+        fields=fields,
+        profile=profile
     )
     
-    if data:
+    if data is not None:
         return jsonify(data)
     else:
         return {"error": "Failed to search TV shows"}, 500
@@ -443,13 +565,20 @@ def search_tv():
 
 @app.route("/movie/<int:movie_id>")
 def movie_detail(movie_id):
-    data, is_cached = get_with_stale_while_revalidate(
+    try:
+        fields, profile = requested_fields("movie")
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    
+    data, is_cached = get_projected(
         key=f"movie_detail_{movie_id}",
         ttl_seconds=get_ttl("detail", "movie_detail"),
-        fetch_function=lambda: fetch_movie_detail(movie_id)
+        fetch_function=lambda: fetch_movie_detail(movie_id),
+        fields=fields,
+        profile=profile
     )
     
-    if data:
+    if data is not None:
         return jsonify(data)
     else:
         return {"error": "Failed to fetch movie details"}, 500
@@ -471,13 +600,20 @@ def movie_images(movie_id):
 
 @app.route("/actor/<int:person_id>")
 def actor_detail(person_id):
-    data, is_cached = get_with_stale_while_revalidate(
+    try:
+        fields, profile = requested_fields("actor")
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    
+    data, is_cached = get_projected(
         key=f"actor_detail_{person_id}",
         ttl_seconds=get_ttl("detail", "actor_detail"),
-        fetch_function=lambda: fetch_actor_detail(person_id)
+        fetch_function=lambda: fetch_actor_detail(person_id),
+        fields=fields,
+        profile=profile
     )
     
-    if data:
+    if data is not None:
         return jsonify(data)
     else:
         return {"error": "Failed to fetch actor details"}, 500
@@ -0,0 +1,480 @@
+"""
+Offline load test / benchmark for the TMDB backend
+
+Starts a local TMDB stub (tmdb_stub.py), boots the app against it with a
+throwaway cache database and drives it with a request mix per scenario:
+
+    cold    - empty cache, every key is fetched upstream on first use
+    warm    - cache primed with the whole key space and still fresh
+    stale   - cache primed but every entry past its TTL (SWR revalidation)
+    search  - search-heavy mix with a long tail of distinct queries
+
+With --warmstart it also measures how long a fresh instance takes to reach a
+steady-state hit rate with and without a cache snapshot (snapshot.py).
+
+Reports p50/p95/p99 latency, requests/second, upstream calls per request and
+server memory. Use --output to write the results as JSON for regression
+tracking.
+
+Usage:
+    python benchmark.py --scenario warm --requests 2000 --concurrency 16
+    python benchmark.py --server gunicorn --workers 2 --output bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import signal
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from tmdb_stub import DEFAULT_CONFIG, StubServer
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+SCENARIOS = ("cold", "warm", "stale", "search")
+
+LIST_ROUTES = ("/popular", "/now_playing", "/upcoming", "/trending")
+SEARCH_WORDS = (
+    "matrix", "star", "love", "war", "night", "dark", "king", "man", "lost",
+    "city", "dead", "blue", "home", "last", "world", "time", "girl", "road",
+)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an unsorted list"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, int(round(pct / 100.0 * len(ordered))))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def zipf_choice(rng, items, skew=1.1):
+    """Pick from items with a Zipf-like popularity skew (first items hottest)"""
+    weights = [1.0 / (i + 1) ** skew for i in range(len(items))]
+    return rng.choices(items, weights=weights, k=1)[0]
+
+
+def build_mix(scenario, count, seed=42):
+    """Build the list of request paths for a scenario"""
+    rng = random.Random(seed)
+    movie_ids = list(range(100, 400))
+    person_ids = list(range(1000, 1100))
+
+    def browse():
+        roll = rng.random()
+        if roll < 0.35:
+            return f"{rng.choice(LIST_ROUTES)}?page={zipf_choice(rng, list(range(1, 11)))}"
+        if roll < 0.65:
+            return f"/movie/{zipf_choice(rng, movie_ids)}"
+        if roll < 0.75:
+            return f"/movie/{zipf_choice(rng, movie_ids)}/images"
+        if roll < 0.82:
+            return f"/movie/{zipf_choice(rng, movie_ids)}/reviews?page=1"
+        if roll < 0.90:
+            return f"/actor/{zipf_choice(rng, person_ids)}"
+        return search()
+
+    def search():
+        # Prefix queries mimic search-as-you-type; tail queries are mostly unique
+        word = zipf_choice(rng, list(SEARCH_WORDS))
+        if rng.random() < 0.3:
+            word = f"{word} {rng.randint(1, 100000)}"
+        else:
+            word = word[:rng.randint(1, len(word))]
+        if rng.random() < 0.85:
+            return f"/search/movie?q={word}&page=1"
+        return f"/search/tv?q={word}"
+
+    if scenario == "search":
+        return [search() if rng.random() < 0.8 else browse() for _ in range(count)]
+    return [browse() for _ in range(count)]
+
+
+def with_profile(paths, profile):
+    """Ask for a response profile (see projection.py) on the routes that support it"""
+    if not profile:
+        return paths
+    projectable = ("/popular", "/now_playing", "/upcoming", "/trending", "/search/", "/actor/")
+    result = []
+    for path in paths:
+        route = path.split("?", 1)[0]
+        if route.startswith(projectable) or (route.startswith("/movie/") and route.count("/") == 2):
+            path = f"{path}{'&' if '?' in path else '?'}profile={profile}"
+        result.append(path)
+    return result
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def process_tree_rss_kb(pid):
+    """Resident memory of a process and its children in KiB (Linux only)"""
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f"/proc/{current}/status") as fh:
+                for line in fh:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1])
+            for task in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{task}/children") as fh:
+                    pending.extend(int(child) for child in fh.read().split())
+        except (FileNotFoundError, ProcessLookupError, PermissionError):
+            continue
+    return total or None
+
+
+class AppServer:
+    """The Flask app running in a subprocess against the stub"""
+
+    def __init__(self, api_base, db_file, server="werkzeug", workers=1, extra_env=None, log_file=None):
+        self.port = free_port()
+        self.base_url = f"http://127.0.0.1:{self.port}"
+        env = {
+            **os.environ,
+            "TMDB_API_BASE": api_base,
+            "TMDB_KEY": "benchmark",
+            "CACHE_DB_FILE": db_file,
+            "PYTHONUNBUFFERED": "1",
+            **(extra_env or {}),
+        }
+        if server == "gunicorn":
+            cmd = [sys.executable, "-m", "gunicorn", "-w", str(workers), "--threads", "4",
+                   "-b", f"127.0.0.1:{self.port}", "app:app"]
+        else:
+            cmd = [sys.executable, "-c",
+                   "import sys, app; app.app.run(host='127.0.0.1', port=int(sys.argv[1]), threaded=True)",
+                   str(self.port)]
+        self.server = server
+        self._log = open(log_file, "a") if log_file else subprocess.DEVNULL
+        self.started_at = time.perf_counter()
+        self.process = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=self._log, stderr=subprocess.STDOUT)
+        self.ready_seconds = None
+
+    def wait_ready(self, timeout=30):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"App exited with code {self.process.returncode}")
+            try:
+                if requests.get(f"{self.base_url}/health", timeout=1).status_code == 200:
+                    self.ready_seconds = time.perf_counter() - self.started_at
+                    return self
+            except requests.RequestException:
+                pass
+            time.sleep(0.1)
+        raise RuntimeError("App did not become ready in time")
+
+    def rss_kb(self):
+        return process_tree_rss_kb(self.process.pid)
+
+    def stop(self):
+        # SIGINT lets the dev server run atexit hooks (flushes cache hit counts)
+        if self.server == "gunicorn":
+            self.process.terminate()
+        else:
+            self.process.send_signal(signal.SIGINT)
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        if self._log is not subprocess.DEVNULL:
+            self._log.close()
+
+
+def run_load(base_url, paths, concurrency, schedule=None):
+    """
+    Send paths to the app and collect per-request results
+
+    Args:
+        schedule: optional list of send offsets in seconds (same length as paths)
+
+    Returns:
+        Tuple of (results, wall_seconds); each result is a dict with
+        path, status, latency_ms and the X-Cache header if present
+    """
+    local = threading.local()
+    start = time.perf_counter()
+
+    def send(index):
+        if schedule is not None:
+            delay = schedule[index] - (time.perf_counter() - start)
+            if delay > 0:
+                time.sleep(delay)
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        path = paths[index]
+        t0 = time.perf_counter()
+        try:
+            res = session.get(f"{base_url}{path}", timeout=60)
+            status, cache = res.status_code, res.headers.get("X-Cache")
+            size = len(res.content)
+        except requests.RequestException:
+            status, cache, size = None, None, 0
+        return {
+            "path": path,
+            "status": status,
+            "latency_ms": (time.perf_counter() - t0) * 1000.0,
+            "finished_s": time.perf_counter() - start,
+            "cache": cache,
+            "bytes": size,
+        }
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(send, range(len(paths))))
+    return results, time.perf_counter() - start
+
+
+def summarize(results, wall_seconds, upstream_calls):
+    """Aggregate per-request results into the reported metrics"""
+    latencies = [r["latency_ms"] for r in results]
+    count = len(results)
+    errors = sum(1 for r in results if r["status"] is None or r["status"] >= 500)
+    summary = {
+        "requests": count,
+        "errors": errors,
+        "error_rate": round(errors / count, 4) if count else 0.0,
+        "wall_seconds": round(wall_seconds, 3),
+        "rps": round(count / wall_seconds, 2) if wall_seconds else None,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50), 2) if latencies else None,
+            "p95": round(percentile(latencies, 95), 2) if latencies else None,
+            "p99": round(percentile(latencies, 99), 2) if latencies else None,
+            "max": round(max(latencies), 2) if latencies else None,
+        },
+        "upstream_calls": upstream_calls,
+        "upstream_calls_per_request": round(upstream_calls / count, 3) if count else None,
+        "response_bytes_avg": round(sum(r["bytes"] for r in results) / count, 1) if count else None,
+    }
+    outcomes = [r["cache"] for r in results if r["cache"]]
+    if outcomes:
+        summary["cache_outcomes"] = {name: outcomes.count(name) for name in sorted(set(outcomes))}
+        summary["hit_ratio"] = round(sum(1 for o in outcomes if o in ("HIT", "STALE")) / len(outcomes), 4)
+    return summary
+
+
+def stub_calls(stub):
+    return requests.get(f"{stub.base_url}/__stats", timeout=5).json()["calls"]
+
+
+def reset_stub(stub):
+    requests.post(f"{stub.base_url}/__reset", timeout=5)
+
+
+def wait_for_upstream_idle(stub, settle=0.5, timeout=30):
+    """Wait until background revalidation stops calling the stub"""
+    deadline = time.time() + timeout
+    last = stub_calls(stub)
+    while time.time() < deadline:
+        time.sleep(settle)
+        current = stub_calls(stub)
+        if current == last:
+            return
+        last = current
+
+
+def expire_cache(db_file):
+    """Push every cached entry past any TTL so reads take the stale path"""
+    conn = sqlite3.connect(db_file)
+    with conn:
+        conn.execute("UPDATE cache SET timestamp = 0")
+    conn.close()
+
+
+def run_scenario(scenario, args, stub):
+    workdir = tempfile.mkdtemp(prefix=f"bench_{scenario}_")
+    db_file = os.path.join(workdir, "cache.db")
+    paths = with_profile(build_mix(scenario, args.requests, seed=args.seed), args.profile)
+    app_server = AppServer(stub.api_base, db_file, args.server, args.workers, log_file=args.app_log)
+    try:
+        app_server.wait_ready()
+        rss_start = app_server.rss_kb()
+
+        if scenario in ("warm", "stale"):
+            # Prime with every distinct key in the mix
+            run_load(app_server.base_url, sorted(set(paths)), args.concurrency)
+            wait_for_upstream_idle(stub)
+            if scenario == "stale":
+                expire_cache(db_file)
+
+        reset_stub(stub)
+        results, wall = run_load(app_server.base_url, paths, args.concurrency)
+        wait_for_upstream_idle(stub)
+        summary = summarize(results, wall, stub_calls(stub))
+        summary["startup_seconds"] = round(app_server.ready_seconds, 3)
+        summary["memory_kb"] = {"rss_start": rss_start, "rss_end": app_server.rss_kb()}
+        summary["distinct_paths"] = len(set(paths))
+        return summary
+    finally:
+        app_server.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def time_to_steady_state(results, target_ratio, window=50):
+    """Seconds and requests until the rolling hit ratio first reaches target_ratio"""
+    ordered = sorted((r for r in results if r["cache"]), key=lambda r: r["finished_s"])
+    hits = [r["cache"] in ("HIT", "STALE") for r in ordered]
+    for end in range(window, len(hits) + 1):
+        if sum(hits[end - window:end]) / window >= target_ratio:
+            return ordered[end - 1]["finished_s"], end
+    return None, None
+
+
+def run_warmstart(args, stub):
+    """Compare a cold boot with a boot that loads a snapshot of a primed cache"""
+    workdir = tempfile.mkdtemp(prefix="bench_warmstart_")
+    snapshot_file = os.path.join(workdir, "snapshot.jsonl.gz")
+    prime_db = os.path.join(workdir, "prime.db")
+    try:
+        primer = AppServer(stub.api_base, prime_db, args.server, args.workers, log_file=args.app_log)
+        try:
+            primer.wait_ready()
+            run_load(primer.base_url, build_mix("cold", args.requests * 2, seed=args.seed), args.concurrency)
+            wait_for_upstream_idle(stub)
+        finally:
+            primer.stop()
+        subprocess.run(
+            [sys.executable, "snapshot.py", "export", snapshot_file],
+            cwd=ROOT, env={**os.environ, "CACHE_DB_FILE": prime_db}, check=True, stdout=subprocess.DEVNULL,
+        )
+
+        report = {"target_hit_ratio": args.steady_hit_ratio, "snapshot_bytes": os.path.getsize(snapshot_file)}
+        paths = build_mix("cold", args.requests, seed=args.seed + 1)
+        for variant in ("empty", "snapshot"):
+            extra_env = {"CACHE_SNAPSHOT_FILE": snapshot_file} if variant == "snapshot" else {}
+            app_server = AppServer(stub.api_base, os.path.join(workdir, f"{variant}.db"), args.server,
+                                   args.workers, extra_env=extra_env, log_file=args.app_log)
+            try:
+                app_server.wait_ready()
+                reset_stub(stub)
+                results, wall = run_load(app_server.base_url, paths, args.concurrency)
+                wait_for_upstream_idle(stub)
+                summary = summarize(results, wall, stub_calls(stub))
+                seconds, count = time_to_steady_state(results, args.steady_hit_ratio)
+                summary["startup_seconds"] = round(app_server.ready_seconds, 3)
+                summary["steady_state_seconds"] = round(app_server.ready_seconds + seconds, 3) if seconds is not None else None
+                summary["steady_state_requests"] = count
+                report[variant] = summary
+            finally:
+                app_server.stop()
+        return report
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def print_table(report):
+    header = f"{'scenario':<10} {'req':>6} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'up/req':>7} {'err':>6} {'rss MB':>8}"
+    print(header)
+    print("-" * len(header))
+    for name, s in report["scenarios"].items():
+        rss = s["memory_kb"]["rss_end"]
+        print(
+            f"{name:<10} {s['requests']:>6} {s['rps']:>9} {s['latency_ms']['p50']:>9} "
+            f"{s['latency_ms']['p95']:>9} {s['latency_ms']['p99']:>9} "
+            f"{s['upstream_calls_per_request']:>7} {s['errors']:>6} "
+            f"{(round(rss / 1024, 1) if rss else '-'):>8}"
+        )
+
+
+def add_stub_arguments(parser):
+    """Stub knobs shared by benchmark.py and replay.py"""
+    parser.add_argument("--latency-ms", type=float, default=DEFAULT_CONFIG["latency_ms"],
+                        help="Upstream latency added by the stub")
+    parser.add_argument("--jitter-ms", type=float, default=DEFAULT_CONFIG["jitter_ms"])
+    parser.add_argument("--error-rate", type=float, default=DEFAULT_CONFIG["error_rate"],
+                        help="Fraction of upstream calls failing with HTTP 500")
+    parser.add_argument("--results-per-page", type=int, default=DEFAULT_CONFIG["results_per_page"],
+                        help="Payload size knob for list/search pages")
+    parser.add_argument("--cast-size", type=int, default=DEFAULT_CONFIG["cast_size"],
+                        help="Payload size knob for credits")
+
+
+def stub_config_from_args(args):
+    return {
+        "latency_ms": args.latency_ms,
+        "jitter_ms": args.jitter_ms,
+        "error_rate": args.error_rate,
+        "results_per_page": args.results_per_page,
+        "cast_size": args.cast_size,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark against a local TMDB stub")
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS,
+                        help="Scenario to run (repeatable, default: all)")
+    parser.add_argument("--requests", type=int, default=1000, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--server", choices=("werkzeug", "gunicorn"), default="werkzeug")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--profile", choices=("card", "full"),
+                        help="Request this response profile on list, search and detail routes")
+    parser.add_argument("--warmstart", action="store_true",
+                        help="Also measure time to steady-state hit rate with and without a snapshot")
+    parser.add_argument("--steady-hit-ratio", type=float, default=0.8,
+                        help="Rolling hit ratio that counts as steady state for --warmstart")
+    parser.add_argument("--app-log", help="Append app stdout/stderr to this file")
+    parser.add_argument("--output", help="Write JSON results to this file")
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    stub_config = stub_config_from_args(args)
+    stub = StubServer(config=stub_config).start()
+    report = {
+        "generated_at": int(time.time()),
+        "python": platform.python_version(),
+        "config": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "server": args.server,
+            "workers": args.workers if args.server == "gunicorn" else 1,
+            "seed": args.seed,
+            "profile": args.profile,
+            "stub": stub_config,
+        },
+        "scenarios": {},
+    }
+    try:
+        for scenario in args.scenario or SCENARIOS:
+            print(f"[BENCH] Running scenario '{scenario}'...", flush=True)
+            report["scenarios"][scenario] = run_scenario(scenario, args, stub)
+        if args.warmstart:
+            print("[BENCH] Running warm start comparison...", flush=True)
+            report["warmstart"] = run_warmstart(args, stub)
+    finally:
+        stub.stop()
+
+    print_table(report)
+    for variant in ("empty", "snapshot"):
+        if "warmstart" in report:
+            w = report["warmstart"][variant]
+            steady = (f"{w['steady_state_seconds']}s / {w['steady_state_requests']} requests"
+                      if w["steady_state_seconds"] is not None else "not reached")
+            print(f"[BENCH] warm start ({variant}): startup {w['startup_seconds']}s, steady state {steady}, "
+                  f"hit ratio {w.get('hit_ratio')}, upstream/req {w['upstream_calls_per_request']}")
+    if args.output:
+        with open(args.output, "w") as fh:
+            json.dump(report, fh, indent=2)
+        print(f"[BENCH] Results written to {args.output}", flush=True)
+
+
+if __name__ == "__main__":
+    main()
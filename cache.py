@@ -1,15 +1,37 @@
 import sqlite3
 import json
 import os
+import socket
 import time
+import gzip
+import atexit
 from concurrent.futures import ThreadPoolExecutor
 import threading
 
-DB_FILE = os.path.join(os.path.dirname(__file__), "cache.db")
+DB_FILE = os.environ.get("CACHE_DB_FILE") or os.path.join(os.path.dirname(__file__), "cache.db")
 
 # Thread pool for background revalidation
 _executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="cache_revalidate")
 _lock = threading.Lock()
+# Per-thread outcome of the last SWR lookup, exposed as the X-Cache header
+_request_state = threading.local()
+
+# Hit counts are buffered in memory and flushed in batches so reads stay read-only
+HIT_FLUSH_THRESHOLD = 50
+HIT_FLUSH_INTERVAL = 30
+# hit_score halves every HIT_HALF_LIFE seconds, so snapshots rank by recent hits
+HIT_HALF_LIFE = 86400
+_pending_hits = {}
+_hits_lock = threading.Lock()
+_last_hit_flush = time.time()
+
+SNAPSHOT_FORMAT = "tmdb-cache-snapshot"
+SNAPSHOT_VERSION = 2
+# Version 1 stored the all-time hit count where version 2 stores the decayed score
+SUPPORTED_SNAPSHOT_VERSIONS = (1, 2)
+# Several gunicorn workers boot at once; one loads the snapshot, the others wait this long for it
+SNAPSHOT_LOAD_LEASE_TTL = 300
+SNAPSHOT_LOAD_WAIT = 20
 
 def init_db():
     conn = sqlite3.connect(DB_FILE)
@@ -43,6 +65,24 @@ def init_db():
                 timestamp INTEGER
             )
         """)
+        
+        # Hit tracking used to rank the hot set for snapshots (added later, so migrate)
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(cache)")}
+        if "hits" not in columns:
+            conn.execute("ALTER TABLE cache ADD COLUMN hits INTEGER NOT NULL DEFAULT 0")
+        if "last_hit" not in columns:
+            conn.execute("ALTER TABLE cache ADD COLUMN last_hit INTEGER")
+        if "hit_score" not in columns:
+            conn.execute("ALTER TABLE cache ADD COLUMN hit_score REAL NOT NULL DEFAULT 0")
+        
+        # Small key/value store for background jobs (changes feed cursor, leases)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS sync_state (
+                name TEXT PRIMARY KEY,
+                value TEXT,
+                updated_at INTEGER
+            )
+        """)
     conn.close()
 
 def get_cached_result(query, media_type):
@@ -127,9 +167,9 @@ def get_stale_cache(key):
         return json.loads(row[0]), row[1]
     return None, None
 
-def save_stale_cache(key, data):
-    """Save data to stale-while-revalidate cache"""
-    current_time = int(time.time())
+def save_stale_cache(key, data, timestamp=None):
+    """Save data to stale-while-revalidate cache (timestamp defaults to now)"""
+    current_time = int(time.time()) if timestamp is None else timestamp
     
     with _lock:  # Prevent race conditions
         conn = sqlite3.connect(DB_FILE)
@@ -155,6 +195,272 @@ def is_cache_fresh(timestamp, ttl_seconds):
     current_time = int(time.time())
     return (current_time - timestamp) < ttl_seconds
 
+def record_hit(key):
+    """Count a cache hit; flushed to the database in batches"""
+    with _hits_lock:
+        _pending_hits[key] = _pending_hits.get(key, 0) + 1
+        pending = sum(_pending_hits.values())
+        due = pending >= HIT_FLUSH_THRESHOLD or time.time() - _last_hit_flush >= HIT_FLUSH_INTERVAL
+    if due:
+        flush_hit_counts()
+
+def flush_hit_counts():
+    """Write buffered hit counts to the cache table"""
+    global _last_hit_flush
+    with _hits_lock:
+        if not _pending_hits:
+            _last_hit_flush = time.time()
+            return
+        pending = list(_pending_hits.items())
+        _pending_hits.clear()
+        _last_hit_flush = time.time()
+    
+    now = int(time.time())
+    try:
+        with _lock:
+            conn = sqlite3.connect(DB_FILE)
+            with conn:
+                updates = []
+                for key, count in pending:
+                    row = conn.execute("SELECT hit_score, last_hit FROM cache WHERE key = ?", (key,)).fetchone()
+                    if row:
+                        updates.append((count, decayed_hit_score(row[0], row[1], now) + count, now, key))
+                conn.executemany(
+                    "UPDATE cache SET hits = hits + ?, hit_score = ?, last_hit = ? WHERE key = ?",
+                    updates,
+                )
+            conn.close()
+    except sqlite3.Error as e:
+        print(f"[SWR CACHE] Failed to flush hit counts: {e}", flush=True)
+
+atexit.register(flush_hit_counts)
+
+def decayed_hit_score(score, last_hit, now):
+    """Hit score as of now, halving every HIT_HALF_LIFE seconds since last_hit"""
+    if not score or last_hit is None:
+        return 0.0
+    return score * 0.5 ** (max(0, now - last_hit) / HIT_HALF_LIFE)
+
+def export_snapshot(path, limit=5000, since_seconds=7 * 86400):
+    """
+    Export the hot set of the SWR cache to a gzipped JSON-lines snapshot
+    
+    Entries are ranked by their decayed hit score, i.e. by recent hits.
+    
+    Args:
+        path: Snapshot file to write
+        limit: Maximum number of entries
+        since_seconds: Only entries hit (or written) within this window
+    
+    Returns:
+        Number of entries exported
+    """
+    flush_hit_counts()
+    now = int(time.time())
+    conn = sqlite3.connect(DB_FILE)
+    candidates = conn.execute(
+        """
+        SELECT key, timestamp, hit_score, last_hit FROM cache
+        WHERE data IS NOT NULL AND COALESCE(last_hit, timestamp) >= ?
+        """,
+        (now - since_seconds,),
+    ).fetchall()
+    ranked = sorted(
+        ((key, timestamp, decayed_hit_score(score, last_hit, now)) for key, timestamp, score, last_hit in candidates),
+        key=lambda row: (row[2], row[1] or 0),
+        reverse=True,
+    )[:limit]
+    
+    with gzip.open(path, "wt", encoding="utf-8") as fh:
+        header = {
+            "format": SNAPSHOT_FORMAT,
+            "version": SNAPSHOT_VERSION,
+            "created_at": now,
+            "entries": len(ranked),
+        }
+        fh.write(json.dumps(header) + "\n")
+        for key, timestamp, score in ranked:
+            row = conn.execute("SELECT data FROM cache WHERE key = ?", (key,)).fetchone()
+            # data is already JSON text, keep it as-is
+            fh.write(json.dumps([key, timestamp, round(score, 3), row[0]]) + "\n")
+    conn.close()
+    
+    print(f"[SWR CACHE] Exported {len(ranked)} entries to '{path}'", flush=True)
+    return len(ranked)
+
+def load_snapshot(path):
+    """
+    Bulk-load a snapshot written by export_snapshot in a single transaction
+    
+    Original timestamps are kept so stale entries still revalidate. Entries
+    already cached with a newer timestamp are left alone.
+    
+    Returns:
+        Number of entries in the snapshot
+    """
+    started = time.perf_counter()
+    with gzip.open(path, "rt", encoding="utf-8") as fh:
+        header = json.loads(fh.readline())
+        if header.get("format") != SNAPSHOT_FORMAT or header.get("version") not in SUPPORTED_SNAPSHOT_VERSIONS:
+            raise ValueError(f"Unsupported cache snapshot: {header}")
+        # Scores keep decaying from the time the snapshot was taken
+        created_at = header.get("created_at")
+        rows = [tuple(json.loads(line)) + (created_at,) for line in fh if line.strip()]
+    
+    with _lock:
+        conn = sqlite3.connect(DB_FILE)
+        with conn:
+            conn.executemany(
+                """
+                INSERT INTO cache (key, timestamp, hit_score, data, last_hit)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET
+                  data=excluded.data,
+                  timestamp=excluded.timestamp,
+                  hit_score=excluded.hit_score,
+                  last_hit=excluded.last_hit
+                WHERE excluded.timestamp > COALESCE(cache.timestamp, 0)
+                """,
+                rows,
+            )
+        conn.close()
+    
+    elapsed = time.perf_counter() - started
+    print(f"[SWR CACHE] Loaded {len(rows)} entries from '{path}' in {elapsed:.3f}s", flush=True)
+    return len(rows)
+
+def mark_stale(patterns, before=None):
+    """
+    Expire SWR entries matching GLOB patterns without dropping their data
+    
+    The next read serves the old data once and revalidates it in the background.
+    
+    Args:
+        patterns: GLOB patterns of cache keys
+        before: only expire entries cached before this unix time
+    
+    Returns:
+        List of keys that were marked stale
+    """
+    condition = "key GLOB ? AND timestamp > 0"
+    if before is not None:
+        condition += " AND timestamp < ?"
+    keys = []
+    with _lock:
+        conn = sqlite3.connect(DB_FILE)
+        with conn:
+            for pattern in patterns:
+                params = (pattern,) if before is None else (pattern, int(before))
+                rows = conn.execute(f"SELECT key FROM cache WHERE {condition}", params).fetchall()
+                if rows:
+                    conn.execute(f"UPDATE cache SET timestamp = 0 WHERE {condition}", params)
+                    keys.extend(row[0] for row in rows)
+        conn.close()
+    
+    if keys:
+        print(f"[SWR CACHE] Marked {len(keys)} entries stale", flush=True)
+    return keys
+
+def oldest_timestamp(patterns):
+    """
+    Oldest timestamp of the fresh SWR entries matching GLOB patterns
+    
+    Returns:
+        Unix time, or None if no entry matches (or all are already stale)
+    """
+    conn = sqlite3.connect(DB_FILE)
+    oldest = None
+    for pattern in patterns:
+        row = conn.execute(
+            "SELECT MIN(timestamp) FROM cache WHERE key GLOB ? AND timestamp > 0", (pattern,)
+        ).fetchone()
+        if row[0] is not None and (oldest is None or row[0] < oldest):
+            oldest = row[0]
+    conn.close()
+    return oldest
+
+def get_sync_state(name):
+    """Read a value from the sync_state table"""
+    conn = sqlite3.connect(DB_FILE)
+    row = conn.execute("SELECT value FROM sync_state WHERE name = ?", (name,)).fetchone()
+    conn.close()
+    return row[0] if row else None
+
+def set_sync_state(name, value):
+    """Write a value to the sync_state table"""
+    with _lock:
+        conn = sqlite3.connect(DB_FILE)
+        with conn:
+            conn.execute(
+                """
+                INSERT INTO sync_state (name, value, updated_at)
+                VALUES (?, ?, strftime('%s','now'))
+                ON CONFLICT(name) DO UPDATE SET
+                  value=excluded.value,
+                  updated_at=excluded.updated_at
+                """,
+                (name, value),
+            )
+        conn.close()
+
+def try_acquire_lease(name, owner, ttl_seconds):
+    """
+    Take or renew a lease so only one process runs a background job
+    
+    Returns:
+        True if owner holds the lease
+    """
+    now = int(time.time())
+    with _lock:
+        conn = sqlite3.connect(DB_FILE)
+        with conn:
+            conn.execute(
+                """
+                INSERT INTO sync_state (name, value, updated_at)
+                VALUES (?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET
+                  value=excluded.value,
+                  updated_at=excluded.updated_at
+                WHERE sync_state.value = excluded.value OR sync_state.updated_at < ?
+                """,
+                (name, owner, now, now - ttl_seconds),
+            )
+            row = conn.execute("SELECT value FROM sync_state WHERE name = ?", (name,)).fetchone()
+        conn.close()
+    return row is not None and row[0] == owner
+
+def load_snapshot_once(path):
+    """
+    Load a snapshot unless this database already has it (once per boot, not per worker)
+    
+    The first worker takes a lease in sync_state and loads the file; the
+    others wait for it to finish instead of each bulk-loading the same rows
+    and contending for the SQLite write lock.
+    
+    Returns:
+        Number of entries loaded by this process (0 if another one did)
+    """
+    stat = os.stat(path)
+    snapshot_id = f"{os.path.abspath(path)}:{stat.st_mtime_ns}:{stat.st_size}"
+    if get_sync_state("snapshot_loaded") == snapshot_id:
+        print(f"[SWR CACHE] Snapshot '{path}' already loaded", flush=True)
+        return 0
+    
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    if try_acquire_lease(f"snapshot_load_lease:{snapshot_id}", owner, SNAPSHOT_LOAD_LEASE_TTL):
+        count = load_snapshot(path)
+        set_sync_state("snapshot_loaded", snapshot_id)
+        return count
+    
+    deadline = time.time() + SNAPSHOT_LOAD_WAIT
+    while time.time() < deadline:
+        if get_sync_state("snapshot_loaded") == snapshot_id:
+            print(f"[SWR CACHE] Snapshot '{path}' loaded by another worker", flush=True)
+            return 0
+        time.sleep(0.2)
+    print(f"[SWR CACHE] Snapshot '{path}' still loading in another worker, serving anyway", flush=True)
+    return 0
+
 def revalidate_in_background(key, fetch_function):
     """Revalidate cache in background thread"""
     def _revalidate():
@@ -169,6 +475,14 @@ def revalidate_in_background(key, fetch_function):
     
     _executor.submit(_revalidate)
 
+def reset_cache_outcome():
+    """Clear the outcome recorded for the current thread (call per request)"""
+    _request_state.outcome = None
+
+def get_cache_outcome():
+    """Outcome of the last SWR lookup on this thread: 'MISS', 'HIT', 'STALE' or None"""
+    return getattr(_request_state, "outcome", None)
+
 def get_with_stale_while_revalidate(key, ttl_seconds, fetch_function):
     """
     Implement stale-while-revalidate caching pattern
@@ -189,14 +503,98 @@ def get_with_stale_while_revalidate(key, ttl_seconds, fetch_function):
         fresh_data = fetch_function()
         if fresh_data:
             save_stale_cache(key, fresh_data)
+        _request_state.outcome = "MISS"
         return fresh_data, False
     
     if is_cache_fresh(timestamp, ttl_seconds):
         # Cache is fresh, return it
         print(f"[SWR CACHE] HIT (fresh): '{key}'", flush=True)
+        record_hit(key)
+        _request_state.outcome = "HIT"
         return cached_data, True
     else:
         # Cache is stale, return it but trigger background revalidation
         print(f"[SWR CACHE] HIT (stale): '{key}' - triggering background revalidation", flush=True)
         revalidate_in_background(key, fetch_function)
+        record_hit(key)
+        _request_state.outcome = "STALE"
         return cached_data, True
+
+def revalidate_derived_in_background(key, derived_key, ttl_seconds, fetch_function, derive):
+    """Rebuild a derived entry in a background thread, refetching its source only if stale"""
+    def _revalidate():
+        try:
+            print(f"[SWR CACHE] Background revalidation started for '{derived_key}'", flush=True)
+            data, timestamp = get_stale_cache(key)
+            if data is None or not is_cache_fresh(timestamp, ttl_seconds):
+                data = fetch_function()
+                if not data:
+                    return
+                timestamp = int(time.time())
+                save_stale_cache(key, data, timestamp)
+            save_stale_cache(derived_key, derive(data), timestamp)
+            print(f"[SWR CACHE] Background revalidation completed for '{derived_key}'", flush=True)
+        except Exception as e:
+            print(f"[SWR CACHE] Background revalidation failed for '{derived_key}': {e}", flush=True)
+    
+    _executor.submit(_revalidate)
+
+def get_derived_with_stale_while_revalidate(key, derived_key, ttl_seconds, fetch_function, derive):
+    """
+    Stale-while-revalidate lookup of data derived from another cache entry
+    
+    The derived entry is cached under derived_key with the timestamp of the
+    source entry it was built from, so it never looks fresher than its source.
+    A missing derived entry is built from the cached source even when that is
+    stale (and revalidated in the background), like a plain stale hit.
+    
+    Args:
+        key: Cache key of the source entry
+        derived_key: Cache key of the derived entry
+        ttl_seconds: Time to live in seconds (applies to both)
+        fetch_function: Function to fetch fresh source data
+        derive: Function building the derived data from the source data
+    
+    Returns:
+        Tuple of (data, is_from_cache)
+    """
+    derived, derived_timestamp = get_stale_cache(derived_key)
+    
+    if derived is not None:
+        if is_cache_fresh(derived_timestamp, ttl_seconds):
+            print(f"[SWR CACHE] HIT (fresh): '{derived_key}'", flush=True)
+            record_hit(derived_key)
+            _request_state.outcome = "HIT"
+        else:
+            print(f"[SWR CACHE] HIT (stale): '{derived_key}' - triggering background revalidation", flush=True)
+            revalidate_derived_in_background(key, derived_key, ttl_seconds, fetch_function, derive)
+            record_hit(derived_key)
+            _request_state.outcome = "STALE"
+        return derived, True
+    
+    data, timestamp = get_stale_cache(key)
+    
+    if data is None:
+        print(f"[SWR CACHE] MISS: '{derived_key}' - fetching fresh data", flush=True)
+        data = fetch_function()
+        derived = None
+        if data:
+            timestamp = int(time.time())
+            save_stale_cache(key, data, timestamp)
+            derived = derive(data)
+            save_stale_cache(derived_key, derived, timestamp)
+        _request_state.outcome = "MISS"
+        return derived, False
+    
+    # Build from the cached source and keep its timestamp
+    derived = derive(data)
+    save_stale_cache(derived_key, derived, timestamp)
+    if is_cache_fresh(timestamp, ttl_seconds):
+        print(f"[SWR CACHE] HIT (fresh): '{key}' - built '{derived_key}'", flush=True)
+        _request_state.outcome = "HIT"
+    else:
+        print(f"[SWR CACHE] HIT (stale): '{key}' - built '{derived_key}', triggering background revalidation", flush=True)
+        revalidate_derived_in_background(key, derived_key, ttl_seconds, fetch_function, derive)
+        _request_state.outcome = "STALE"
+    record_hit(derived_key)
+    return derived, True
@@ -0,0 +1,198 @@
+"""
+Event-driven invalidation from the TMDB changes feeds
+
+Polls /movie/changes and /person/changes and marks the cached entries of the
+changed ids stale (optionally re-warming them right away). The feed cursor is
+persisted in the sync_state table so restarts pick up where they left off;
+without one (first poll on a fresh disk), the window starts at the oldest
+cached entry, at most 14 days back, and older entries are expired.
+
+TMDB reports changes per day, so each poll re-reads the days since the
+cursor and the same id can come back on every poll. Ids reported for the
+first time expire all their entries; for ids seen before, the per-id
+changes endpoint gives the time of the latest change, and only entries
+cached before it are expired (entries refreshed since already reflect it).
+
+Enabled in app.py with TMDB_CHANGES_POLL_INTERVAL (seconds). Run a single
+poll by hand with:
+    python changes.py
+"""
+import json
+import os
+import socket
+import threading
+import time
+from datetime import date, datetime, time as dt_time, timedelta, timezone
+
+import requests
+
+from cache import get_sync_state, mark_stale, oldest_timestamp, set_sync_state, try_acquire_lease
+
+# TMDB only serves changes for the last 14 days
+MAX_WINDOW_DAYS = 14
+CURSOR_KEY = "changes_cursor_{kind}"
+SEEN_IDS_KEY = "changes_seen_{kind}"
+LEASE_KEY = "changes_poller_lease"
+
+# Cache keys affected by a change, per feed (GLOB patterns, see app.py routes);
+# ":*" covers projected variants (projection.projected_key)
+INVALIDATION_PATTERNS = {
+    "movie": ("movie_detail_{id}", "movie_detail_{id}:*", "movie_images_{id}", "movie_reviews_{id}_page_*"),
+    "person": ("actor_detail_{id}", "actor_detail_{id}:*"),
+}
+
+
+def fetch_changed_ids(api_base, headers, kind, start_date, end_date):
+    """Collect the ids listed by a changes feed between two dates (all pages)"""
+    ids = set()
+    page, total_pages = 1, 1
+    while page <= total_pages:
+        res = requests.get(
+            f"{api_base}/{kind}/changes",
+            headers=headers,
+            params={"start_date": start_date.isoformat(), "end_date": end_date.isoformat(), "page": page},
+            timeout=10,
+        )
+        if res.status_code != 200:
+            raise RuntimeError(f"{kind} changes feed returned {res.status_code}")
+        data = res.json()
+        ids.update(item["id"] for item in data.get("results", []) if "id" in item)
+        total_pages = data.get("total_pages", 1) or 1
+        page += 1
+    return ids
+
+
+def fetch_last_change_time(api_base, headers, kind, item_id, start_date, end_date):
+    """Unix time of the latest change to one id between two dates (None if there is none)"""
+    res = requests.get(
+        f"{api_base}/{kind}/{item_id}/changes",
+        headers=headers,
+        params={"start_date": start_date.isoformat(), "end_date": end_date.isoformat()},
+        timeout=10,
+    )
+    if res.status_code != 200:
+        raise RuntimeError(f"{kind} {item_id} changes returned {res.status_code}")
+    times = [
+        datetime.strptime(item["time"], "%Y-%m-%d %H:%M:%S %Z").replace(tzinfo=timezone.utc).timestamp()
+        for change in res.json().get("changes", [])
+        for item in change.get("items", [])
+        if "time" in item
+    ]
+    return int(max(times)) if times else None
+
+
+def poll_changes(api_base, api_key, rewarm=None, today=None):
+    """
+    Run one poll of every changes feed
+
+    Args:
+        api_base: TMDB API base URL
+        api_key: TMDB bearer token
+        rewarm: optional callable(key) that refetches a key marked stale
+        today: override of the current UTC date (for testing)
+
+    Returns:
+        Dict of kind -> number of cache entries marked stale
+    """
+    headers = {"Authorization": f"Bearer {api_key}"}
+    today = today or datetime.now(timezone.utc).date()
+    summary = {}
+
+    for kind, patterns in INVALIDATION_PATTERNS.items():
+        all_patterns = [pattern.format(id="*") for pattern in patterns]
+        cursor = get_sync_state(CURSOR_KEY.format(kind=kind))
+        keys = []
+        if cursor:
+            start = date.fromisoformat(cursor)
+        else:
+            # First poll (e.g. a fresh disk warmed from a snapshot): cover what is already cached
+            oldest = oldest_timestamp(all_patterns)
+            start = datetime.fromtimestamp(oldest, timezone.utc).date() if oldest else today
+            earliest = today - timedelta(days=MAX_WINDOW_DAYS)
+            if start < earliest:
+                # The feed can't tell about older entries
+                keys = mark_stale(all_patterns, before=datetime.combine(earliest, dt_time(), timezone.utc).timestamp())
+                start = earliest
+
+        if (today - start).days > MAX_WINDOW_DAYS:
+            # Missed more than the feed can tell us, so expire everything it covers
+            print(f"[CHANGES] {kind} cursor {cursor} is too old, expiring all {kind} entries", flush=True)
+            keys = mark_stale(all_patterns)
+            ids = set()
+        else:
+            ids = fetch_changed_ids(api_base, headers, kind, start, today)
+            # Ids reported by earlier polls of the current window
+            seen = json.loads(get_sync_state(SEEN_IDS_KEY.format(kind=kind)) or "[]") if cursor else []
+            seen = {int(i) for i in seen}
+            new_ids = ids - seen
+            keys += mark_stale([pattern.format(id=i) for i in new_ids for pattern in patterns])
+            for i in ids & seen:
+                item_patterns = [pattern.format(id=i) for pattern in patterns]
+                if oldest_timestamp(item_patterns) is None:
+                    continue  # Nothing refreshed since the last poll expired it
+                changed_at = fetch_last_change_time(api_base, headers, kind, i, start, today)
+                if changed_at is not None:
+                    # Same second counts as before: the entry may predate the change
+                    keys += mark_stale(item_patterns, before=changed_at + 1)
+            print(f"[CHANGES] {kind}: {len(new_ids)} new changed ids since {start} "
+                  f"({len(ids) - len(new_ids)} seen before), {len(keys)} cached entries stale", flush=True)
+
+        # Only advance once the window was fully processed
+        set_sync_state(SEEN_IDS_KEY.format(kind=kind), json.dumps(sorted(ids)))
+        set_sync_state(CURSOR_KEY.format(kind=kind), today.isoformat())
+        summary[kind] = len(keys)
+
+        if rewarm:
+            for key in keys:
+                try:
+                    rewarm(key)
+                except Exception as e:
+                    print(f"[CHANGES] Re-warm failed for '{key}': {e}", flush=True)
+
+    return summary
+
+
+class ChangesPoller:
+    """Background thread polling the changes feeds every interval seconds"""
+
+    def __init__(self, api_base, api_key, interval, rewarm=None):
+        self.api_base = api_base
+        self.api_key = api_key
+        self.interval = interval
+        self.rewarm = rewarm
+        # With several gunicorn workers only the lease holder polls
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="changes_poller", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        print(f"[CHANGES] Poller started (every {self.interval}s)", flush=True)
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if try_acquire_lease(LEASE_KEY, self.owner, self.interval * 2):
+                    poll_changes(self.api_base, self.api_key, self.rewarm)
+            except Exception as e:
+                print(f"[CHANGES] Poll failed: {e}", flush=True)
+            self._stop.wait(self.interval)
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    from cache import init_db
+
+    load_dotenv()
+    init_db()
+    started = time.perf_counter()
+    result = poll_changes(
+        os.environ.get("TMDB_API_BASE", "https://api.themoviedb.org/3").rstrip("/"),
+        os.environ.get("TMDB_KEY"),
+    )
+    print(f"[CHANGES] Done in {time.perf_counter() - started:.2f}s: {result}", flush=True)
@@ -1,5 +1,6 @@
 # Cache TTL Configuration (in seconds)
 # This file centralizes all cache time-to-live settings for easy management
+import os
 
 # List endpoints - these change frequently and need different refresh rates
 LIST_ENDPOINTS_TTL = {
@@ -17,12 +18,38 @@ DETAIL_ENDPOINTS_TTL = {
     "movie_reviews": 7200,  # 2 hours - reviews don't change very frequently
 }
 
+# Seconds between TMDB changes feed polls (0 disables the poller, see changes.py)
+CHANGES_POLL_INTERVAL = int(os.environ.get("TMDB_CHANGES_POLL_INTERVAL", 0))
+
+# With the changes feed invalidating edited entries, detail data can live much longer
+CHANGES_FEED_DETAIL_TTL = {
+    "movie_detail": 604800,  # 7 days
+    "actor_detail": 604800,  # 7 days
+    "movie_images": 604800,  # 7 days
+}
+if CHANGES_POLL_INTERVAL > 0:
+    DETAIL_ENDPOINTS_TTL.update(CHANGES_FEED_DETAIL_TTL)
+
 # Search endpoints - balance between freshness and performance
 SEARCH_ENDPOINTS_TTL = {
     "movie_search": 3600,   # 1 hour - search relevance can change
     "tv_search": 3600,      # 1 hour - search relevance can change
 }
 
+# Optional overrides from the environment, mainly for replay.py experiments
+#   CACHE_TTL_OVERRIDES="movie_detail=86400,popular=600"
+#   CACHE_TTL_SCALE=0.1   (multiplies every TTL, e.g. for accelerated replay)
+def _parse_ttl_overrides(value):
+    overrides = {}
+    for item in (value or "").split(","):
+        if "=" in item:
+            name, seconds = item.split("=", 1)
+            overrides[name.strip()] = int(seconds)
+    return overrides
+
+TTL_OVERRIDES = _parse_ttl_overrides(os.environ.get("CACHE_TTL_OVERRIDES"))
+TTL_SCALE = float(os.environ.get("CACHE_TTL_SCALE", 1.0))
+
 # Utility function to get TTL by endpoint type and key
 def get_ttl(endpoint_type, key=None):
     """
@@ -42,7 +69,8 @@ def get_ttl(endpoint_type, key=None):
     }
     
     if endpoint_type in ttl_maps and key in ttl_maps[endpoint_type]:
-        return ttl_maps[endpoint_type][key]
+        ttl = TTL_OVERRIDES.get(key, ttl_maps[endpoint_type][key])
+        return max(1, int(ttl * TTL_SCALE))
     
     return None
 
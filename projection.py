@@ -0,0 +1,112 @@
+"""
+Field projection for API responses
+
+Clients can ask for a subset of fields with ?fields=id,title or a named
+profile with ?profile=card. List payloads (TMDB pages with "results") are
+projected per item and keep their paging fields.
+
+Only named profiles are cached as separate variants; ad-hoc field lists are
+projected from the cached full payload on each request, so clients can't
+grow the cache by varying the query string.
+"""
+
+# Fields a client may ask for, per payload shape
+ALLOWED_FIELDS = {
+    # Items of TMDB movie list/search pages
+    "movie_list": (
+        "adult", "backdrop_path", "genre_ids", "id", "original_language", "original_title",
+        "overview", "popularity", "poster_path", "release_date", "title", "video",
+        "vote_average", "vote_count",
+    ),
+    # Items of TMDB TV search pages
+    "tv_list": (
+        "adult", "backdrop_path", "first_air_date", "genre_ids", "id", "name", "origin_country",
+        "original_language", "original_name", "overview", "popularity", "poster_path",
+        "vote_average", "vote_count",
+    ),
+    # fetch_movie_detail() payload
+    "movie": (
+        "backdrops", "cast", "director", "genres", "id", "overview", "poster_path",
+        "release_date", "streaming_providers", "title", "vote_average", "vote_count",
+        "youtube_videos",
+    ),
+    # fetch_actor_detail() payload
+    "actor": (
+        "biography", "birthday", "id", "known_for_department", "movies", "name",
+        "place_of_birth", "profile_path",
+    ),
+}
+
+# Named profiles per payload shape; None means the full payload
+PROFILES = {
+    "movie_list": {
+        "card": ("id", "title", "poster_path", "vote_average"),
+        "full": None,
+    },
+    "tv_list": {
+        "card": ("id", "name", "poster_path", "vote_average"),
+        "full": None,
+    },
+    "movie": {
+        "card": ("id", "title", "poster_path", "vote_average"),
+        "full": None,
+    },
+    "actor": {
+        "card": ("id", "name", "profile_path", "known_for_department"),
+        "full": None,
+    },
+}
+
+
+def parse_fields(fields_param, profile_param, resource):
+    """
+    Resolve ?fields= / ?profile= into a sorted tuple of field names
+
+    Returns:
+        Tuple of (fields, profile): fields is None for the full payload,
+        profile is the profile name or None for an ad-hoc field list
+
+    Raises:
+        ValueError: for unknown profiles or fields
+    """
+    if fields_param and profile_param:
+        raise ValueError("Use either 'fields' or 'profile', not both")
+
+    if profile_param:
+        profiles = PROFILES.get(resource, {})
+        if profile_param not in profiles:
+            raise ValueError(f"Unknown profile '{profile_param}', expected one of: {', '.join(profiles)}")
+        fields = profiles[profile_param]
+        return (tuple(sorted(fields)), profile_param) if fields else (None, None)
+
+    if fields_param:
+        fields = {f.strip() for f in fields_param.split(",") if f.strip()}
+        if not fields:
+            raise ValueError("'fields' must list at least one field")
+        unknown = fields - set(ALLOWED_FIELDS.get(resource, ()))
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+        return tuple(sorted(fields)), None
+
+    return None, None
+
+
+def project(data, fields):
+    """Keep only the given fields of a detail payload or of each list item"""
+    if fields is None or data is None:
+        return data
+    if isinstance(data, dict) and isinstance(data.get("results"), list):
+        return {
+            **{k: v for k, v in data.items() if k != "results"},
+            "results": [project(item, fields) for item in data["results"]],
+        }
+    if isinstance(data, list):
+        return [project(item, fields) for item in data]
+    if isinstance(data, dict):
+        return {k: data[k] for k in fields if k in data}
+    return data
+
+
+def projected_key(key, profile):
+    """Cache key of a profile variant (':' keeps it out of other keys' GLOB patterns)"""
+    return f"{key}:profile={profile}"
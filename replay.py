@@ -0,0 +1,170 @@
+"""
+Replay traffic captured by traffic.py against a local instance
+
+By default starts the TMDB stub and a fresh app instance (empty throwaway
+cache) so hit ratio and upstream amplification can be compared across TTL
+settings. --target replays against an already running instance instead.
+
+Requests are sent at their original spacing divided by --speed (0 sends as
+fast as --concurrency allows). When the app is started here, TTLs are scaled
+by 1/speed so entries expire at the same point of the replayed timeline.
+
+Usage:
+    python replay.py traffic.jsonl traffic.jsonl.1 --speed 10
+    python replay.py traffic.jsonl --ttl movie_detail=86400 --ttl popular=900 --output replay.json
+    python replay.py traffic.jsonl --target http://127.0.0.1:5000 --speed 0
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+from urllib.parse import urlencode
+
+import requests
+
+from benchmark import (
+    AppServer,
+    add_stub_arguments,
+    run_load,
+    stub_config_from_args,
+    summarize,
+    wait_for_upstream_idle,
+)
+from tmdb_stub import StubServer
+
+
+def load_capture(files):
+    """Read captured records from one or more JSONL files, oldest first"""
+    records = []
+    for path in files:
+        with open(path) as fh:
+            for line_no, line in enumerate(fh, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"[REPLAY] Skipping malformed line {path}:{line_no}", flush=True)
+                    continue
+                if record.get("method", "GET") == "GET" and record.get("path"):
+                    records.append(record)
+    records.sort(key=lambda r: r.get("ts", 0))
+    return records
+
+
+def record_url(record):
+    params = record.get("params") or {}
+    return f"{record['path']}?{urlencode(params)}" if params else record["path"]
+
+
+def capture_summary(records):
+    """Metrics as observed when the traffic was recorded"""
+    outcomes = [r["cache"] for r in records if r.get("cache")]
+    durations = [r["duration_ms"] for r in records if r.get("duration_ms") is not None]
+    span = records[-1]["ts"] - records[0]["ts"] if len(records) > 1 else 0
+    return {
+        "requests": len(records),
+        "span_seconds": round(span, 3),
+        "hit_ratio": round(sum(1 for o in outcomes if o in ("HIT", "STALE")) / len(outcomes), 4) if outcomes else None,
+        "median_duration_ms": sorted(durations)[len(durations) // 2] if durations else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay captured traffic against a local instance")
+    parser.add_argument("files", nargs="+", help="Capture files written by traffic.py")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="Time compression factor (1 = original pace, 0 = as fast as possible)")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--target", help="Base URL of a running instance instead of starting one")
+    parser.add_argument("--stub-url", help="Stub base URL for upstream counts when using --target")
+    parser.add_argument("--server", choices=("werkzeug", "gunicorn"), default="werkzeug")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers")
+    parser.add_argument("--ttl", action="append", default=[], metavar="KEY=SECONDS",
+                        help="TTL override for the started instance (repeatable)")
+    parser.add_argument("--ttl-scale", type=float,
+                        help="TTL multiplier for the started instance (default: 1/speed)")
+    parser.add_argument("--limit", type=int, help="Replay only the first N requests")
+    parser.add_argument("--app-log", help="Append app stdout/stderr to this file")
+    parser.add_argument("--output", help="Write JSON results to this file")
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    records = load_capture(args.files)[:args.limit]
+    if not records:
+        parser.error("No replayable requests found")
+    paths = [record_url(r) for r in records]
+    schedule = None
+    if args.speed > 0:
+        start_ts = records[0].get("ts", 0)
+        schedule = [(r.get("ts", start_ts) - start_ts) / args.speed for r in records]
+
+    stub = app_server = workdir = None
+    stub_url = args.stub_url
+    ttl_scale = args.ttl_scale if args.ttl_scale is not None else (1.0 / args.speed if args.speed > 0 else 1.0)
+    try:
+        if args.target:
+            base_url = args.target.rstrip("/")
+        else:
+            stub = StubServer(config=stub_config_from_args(args)).start()
+            stub_url = stub.base_url
+            workdir = tempfile.mkdtemp(prefix="replay_")
+            extra_env = {"CACHE_TTL_SCALE": str(ttl_scale)}
+            if args.ttl:
+                extra_env["CACHE_TTL_OVERRIDES"] = ",".join(args.ttl)
+            app_server = AppServer(stub.api_base, os.path.join(workdir, "cache.db"), args.server,
+                                   args.workers, extra_env=extra_env, log_file=args.app_log).wait_ready()
+            base_url = app_server.base_url
+
+        if stub_url:
+            requests.post(f"{stub_url}/__reset", timeout=5)
+        print(f"[REPLAY] Replaying {len(paths)} requests against {base_url} (speed={args.speed})", flush=True)
+        results, wall = run_load(base_url, paths, args.concurrency, schedule=schedule)
+
+        upstream = None
+        if stub_url:
+            if stub:
+                wait_for_upstream_idle(stub)
+            upstream = requests.get(f"{stub_url}/__stats", timeout=5).json()["calls"]
+        replay = summarize(results, wall, upstream if upstream is not None else 0)
+        if upstream is None:
+            replay["upstream_calls"] = replay["upstream_calls_per_request"] = None
+        # Upstream amplification: TMDB calls per client request
+        replay["upstream_amplification"] = replay.pop("upstream_calls_per_request")
+    finally:
+        if app_server:
+            app_server.stop()
+        if stub:
+            stub.stop()
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "generated_at": int(time.time()),
+        "files": args.files,
+        "config": {
+            "speed": args.speed,
+            "concurrency": args.concurrency,
+            "target": args.target,
+            "ttl_overrides": args.ttl,
+            "ttl_scale": None if args.target else ttl_scale,
+        },
+        "capture": capture_summary(records),
+        "replay": replay,
+    }
+    lat = replay["latency_ms"]
+    print(f"[REPLAY] requests={replay['requests']} errors={replay['errors']} "
+          f"hit_ratio={replay.get('hit_ratio')} (captured {report['capture']['hit_ratio']}) "
+          f"upstream_amplification={replay['upstream_amplification']} "
+          f"p50={lat['p50']}ms p95={lat['p95']}ms p99={lat['p99']}ms rps={replay['rps']}", flush=True)
+    if args.output:
+        with open(args.output, "w") as fh:
+            json.dump(report, fh, indent=2)
+        print(f"[REPLAY] Results written to {args.output}", flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""
+Export / import cache snapshots for fast warm starts
+
+The exported file holds the hot set of the SWR cache (ranked by recent hits)
+with original timestamps. Ship it with a deploy and point CACHE_SNAPSHOT_FILE
+at it; app.py loads it at startup before serving requests.
+
+Usage:
+    python snapshot.py export cache_snapshot.jsonl.gz --limit 5000 --since-days 7
+    python snapshot.py import cache_snapshot.jsonl.gz
+
+CACHE_DB_FILE selects the database, as for the app.
+"""
+import argparse
+
+from cache import export_snapshot, init_db, load_snapshot
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export or import cache snapshots")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Write the hot set to a snapshot file")
+    export_parser.add_argument("path")
+    export_parser.add_argument("--limit", type=int, default=5000, help="Maximum entries to export")
+    export_parser.add_argument("--since-days", type=float, default=7,
+                               help="Only entries hit within this many days")
+
+    import_parser = subparsers.add_parser("import", help="Bulk-load a snapshot file")
+    import_parser.add_argument("path")
+
+    args = parser.parse_args()
+    init_db()
+    if args.command == "export":
+        export_snapshot(args.path, limit=args.limit, since_seconds=int(args.since_days * 86400))
+    else:
+        load_snapshot(args.path)
+
+
+if __name__ == "__main__":
+    main()
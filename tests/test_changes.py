@@ -0,0 +1,100 @@
+"""
+poll_changes against the local TMDB stub
+"""
+import time
+from datetime import datetime, timezone
+
+import pytest
+import requests
+
+import cache
+from changes import poll_changes
+from tmdb_stub import StubServer
+
+
+@pytest.fixture
+def stub():
+    server = StubServer(config={"latency_ms": 0, "jitter_ms": 0}).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture(autouse=True)
+def cache_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, "DB_FILE", str(tmp_path / "cache.db"))
+    cache.init_db()
+
+
+def set_changes(stub, movie_changes):
+    """Report movie changes for today: {id: unix time of the change}"""
+    ids = [
+        {"id": i, "time": datetime.fromtimestamp(t, timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC")}
+        for i, t in movie_changes.items()
+    ]
+    requests.post(f"{stub.base_url}/__changes", json={"movie": ids}, timeout=5).raise_for_status()
+
+
+def is_fresh(key):
+    return cache.oldest_timestamp([key]) is not None
+
+
+def test_new_id_expires_cached_entries(stub):
+    now = int(time.time())
+    cache.save_stale_cache("movie_detail_603", {"id": 603}, timestamp=now - 100)
+    cache.save_stale_cache("movie_detail_603:profile=card", {"id": 603}, timestamp=now - 100)
+    cache.save_stale_cache("movie_detail_604", {"id": 604}, timestamp=now - 100)
+    set_changes(stub, {603: now - 50})
+
+    assert poll_changes(stub.api_base, "test")["movie"] == 2
+    assert not is_fresh("movie_detail_603")
+    assert not is_fresh("movie_detail_603:profile=card")
+    assert is_fresh("movie_detail_604")
+
+
+def test_repeated_id_edited_again_expires_refreshed_entries(stub):
+    now = int(time.time())
+    cache.save_stale_cache("movie_detail_603", {"id": 603}, timestamp=now - 100)
+    set_changes(stub, {603: now - 80})
+    poll_changes(stub.api_base, "test")
+
+    # Refetched after the first edit: the next poll reports 603 again but leaves it alone
+    cache.save_stale_cache("movie_detail_603", {"id": 603}, timestamp=now - 60)
+    assert poll_changes(stub.api_base, "test")["movie"] == 0
+    assert is_fresh("movie_detail_603")
+
+    # Edited again the same day, after the refetch
+    set_changes(stub, {603: now - 40})
+    assert poll_changes(stub.api_base, "test")["movie"] == 1
+    assert not is_fresh("movie_detail_603")
+
+
+def test_repeated_id_without_cached_entries_skips_per_id_lookup(stub):
+    now = int(time.time())
+    set_changes(stub, {603: now - 80})
+    poll_changes(stub.api_base, "test")
+    requests.post(f"{stub.base_url}/__reset", timeout=5)
+
+    poll_changes(stub.api_base, "test")
+    stats = requests.get(f"{stub.base_url}/__stats", timeout=5).json()
+    assert "/3/movie/<int:item_id>/changes" not in stats["by_endpoint"]
+
+
+def test_first_poll_covers_changes_since_oldest_cached_entry(stub):
+    now = int(time.time())
+    two_days_ago = datetime.fromtimestamp(now - 2 * 86400, timezone.utc).date().isoformat()
+    # Loaded from a snapshot taken three days ago, changed the day after
+    cache.save_stale_cache("movie_detail_603", {"id": 603}, timestamp=now - 3 * 86400)
+    requests.post(f"{stub.base_url}/__changes", json={"movie": {two_days_ago: [603]}}, timeout=5).raise_for_status()
+
+    assert poll_changes(stub.api_base, "test")["movie"] == 1
+    assert not is_fresh("movie_detail_603")
+
+
+def test_first_poll_expires_entries_older_than_the_feed(stub):
+    now = int(time.time())
+    cache.save_stale_cache("movie_detail_603", {"id": 603}, timestamp=now - 20 * 86400)
+    cache.save_stale_cache("movie_detail_604", {"id": 604}, timestamp=now - 86400)
+
+    assert poll_changes(stub.api_base, "test")["movie"] == 1
+    assert not is_fresh("movie_detail_603")
+    assert is_fresh("movie_detail_604")
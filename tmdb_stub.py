@@ -0,0 +1,360 @@
+"""
+Local stub of the TMDB API endpoints used by app.py
+
+Serves deterministic fake payloads so the app can be benchmarked offline.
+Point the app at it with TMDB_API_BASE=http://127.0.0.1:<port>/3
+
+Usage:
+    python tmdb_stub.py --port 8001 --latency-ms 80 --error-rate 0.01
+"""
+import argparse
+import random
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+
+from flask import Flask, abort, jsonify, make_response, request
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+DEFAULT_CONFIG = {
+    "latency_ms": 50,        # Base latency added to every upstream call
+    "jitter_ms": 20,         # Random extra latency (0..jitter_ms)
+    "error_rate": 0.0,       # Fraction of calls answered with HTTP 500
+    "results_per_page": 20,  # Items per list/search page (TMDB uses 20)
+    "total_pages": 500,      # Pages advertised by list endpoints
+    "cast_size": 40,         # Cast/crew entries per credits payload
+    "image_count": 30,       # Backdrops per images payload
+    "video_count": 10,       # Videos per videos payload
+    "overview_chars": 400,   # Length of overview/biography text
+}
+
+
+def create_stub_app(config=None):
+    """Build the stub Flask app; config overrides DEFAULT_CONFIG"""
+    stub = Flask(__name__)
+    stub.config["STUB"] = {**DEFAULT_CONFIG, **(config or {})}
+    stats = {"calls": 0, "errors": 0, "by_endpoint": {}}
+    # Changes reported by the feeds per day (ISO date -> {id: change time}), set through POST /__changes
+    changed_ids = {"movie": {}, "person": {}}
+    stats_lock = threading.Lock()
+
+    def cfg(name):
+        return stub.config["STUB"][name]
+
+    def text(rng, chars):
+        words = []
+        while sum(len(w) + 1 for w in words) < chars:
+            words.append("".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(2, 9))))
+        return " ".join(words)[:chars]
+
+    def movie_item(movie_id):
+        rng = random.Random(movie_id)
+        return {
+            "id": movie_id,
+            "title": f"Movie {movie_id}",
+            "original_title": f"Movie {movie_id}",
+            "overview": text(rng, cfg("overview_chars")),
+            "poster_path": f"/poster_{movie_id}.jpg",
+            "backdrop_path": f"/backdrop_{movie_id}.jpg",
+            "release_date": f"20{rng.randint(0, 25):02d}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            "vote_average": round(rng.uniform(3, 9), 1),
+            "vote_count": rng.randint(0, 20000),
+            "popularity": round(rng.uniform(1, 500), 3),
+            "genre_ids": rng.sample(range(10, 40), 3),
+            "adult": False,
+            "original_language": "en",
+            "video": False,
+        }
+
+    def page_payload(seed, page):
+        size = cfg("results_per_page")
+        rng = random.Random(f"{seed}:{page}")
+        return {
+            "page": page,
+            "results": [movie_item(rng.randint(1, 1_000_000)) for _ in range(size)],
+            "total_pages": cfg("total_pages"),
+            "total_results": cfg("total_pages") * size,
+        }
+
+    @stub.before_request
+    def simulate_upstream():
+        if request.path.startswith("/__"):
+            return None
+        with stats_lock:
+            stats["calls"] += 1
+            endpoint = request.url_rule.rule if request.url_rule else request.path
+            stats["by_endpoint"][endpoint] = stats["by_endpoint"].get(endpoint, 0) + 1
+        delay = cfg("latency_ms") + random.uniform(0, cfg("jitter_ms"))
+        time.sleep(delay / 1000.0)
+        if random.random() < cfg("error_rate"):
+            with stats_lock:
+                stats["errors"] += 1
+            return {"status_code": 11, "status_message": "Internal error (stub)."}, 500
+        return None
+
+    @stub.route("/3/movie/popular")
+    @stub.route("/3/movie/now_playing")
+    @stub.route("/3/movie/upcoming")
+    @stub.route("/3/trending/movie/week")
+    def movie_list():
+        return jsonify(page_payload(request.path, request.args.get("page", 1, type=int)))
+
+    @stub.route("/3/search/movie")
+    @stub.route("/3/search/tv")
+    def search():
+        query = request.args.get("query", "")
+        if not query:
+            abort(422)
+        return jsonify(page_payload(f"{request.path}:{query}", request.args.get("page", 1, type=int)))
+
+    @stub.route("/3/movie/<int:movie_id>")
+    def movie_detail(movie_id):
+        rng = random.Random(movie_id)
+        return jsonify({
+            **movie_item(movie_id),
+            "genres": [{"id": g, "name": f"Genre {g}"} for g in rng.sample(range(10, 40), 3)],
+            "runtime": rng.randint(80, 180),
+            "tagline": text(rng, 60),
+        })
+
+    @stub.route("/3/movie/<int:movie_id>/images")
+    def movie_images(movie_id):
+        return jsonify({
+            "id": movie_id,
+            "backdrops": [
+                {"file_path": f"/backdrop_{movie_id}_{i}.jpg", "width": 1920, "height": 1080,
+                 "aspect_ratio": 1.778, "vote_average": 5.0, "vote_count": 1}
+                for i in range(cfg("image_count"))
+            ],
+            "posters": [],
+        })
+
+    @stub.route("/3/movie/<int:movie_id>/credits")
+    def movie_credits(movie_id):
+        size = cfg("cast_size")
+        return jsonify({
+            "id": movie_id,
+            "cast": [
+                {"id": movie_id * 100 + i, "name": f"Actor {i}", "character": f"Character {i}",
+                 "profile_path": f"/profile_{i}.jpg", "order": i}
+                for i in range(size)
+            ],
+            "crew": [
+                {"id": movie_id * 1000 + i, "name": f"Crew {i}", "job": "Director" if i == 0 else "Producer",
+                 "department": "Directing" if i == 0 else "Production"}
+                for i in range(size)
+            ],
+        })
+
+    @stub.route("/3/movie/<int:movie_id>/videos")
+    def movie_videos(movie_id):
+        return jsonify({
+            "id": movie_id,
+            "results": [
+                {"key": f"vid{movie_id}x{i}", "name": f"Video {i}", "site": "YouTube",
+                 "type": "Trailer" if i % 3 == 0 else "Teaser" if i % 3 == 1 else "Featurette",
+                 "official": i % 2 == 0}
+                for i in range(cfg("video_count"))
+            ],
+        })
+
+    @stub.route("/3/movie/<int:movie_id>/watch/providers")
+    def movie_providers(movie_id):
+        provider = {"provider_id": 8, "provider_name": "Netflix", "logo_path": "/netflix.jpg"}
+        return jsonify({
+            "id": movie_id,
+            "results": {
+                country: {"link": f"https://www.themoviedb.org/movie/{movie_id}/watch?locale={country}",
+                          "flatrate": [provider], "rent": [provider], "buy": [provider]}
+                for country in ("US", "GB", "AR", "ES", "DE")
+            },
+        })
+
+    @stub.route("/3/movie/<int:movie_id>/reviews")
+    def movie_reviews(movie_id):
+        page = request.args.get("page", 1, type=int)
+        rng = random.Random(f"reviews:{movie_id}:{page}")
+        return jsonify({
+            "id": movie_id,
+            "page": page,
+            "results": [
+                {"id": f"r{movie_id}{i}", "author": f"Author {i}", "content": text(rng, cfg("overview_chars"))}
+                for i in range(cfg("results_per_page"))
+            ],
+            "total_pages": 5,
+            "total_results": 5 * cfg("results_per_page"),
+        })
+
+    @stub.route("/3/person/<int:person_id>")
+    def person_detail(person_id):
+        rng = random.Random(person_id)
+        return jsonify({
+            "id": person_id,
+            "name": f"Person {person_id}",
+            "biography": text(rng, cfg("overview_chars") * 3),
+            "profile_path": f"/profile_{person_id}.jpg",
+            "birthday": "1970-01-01",
+            "place_of_birth": "Somewhere",
+            "known_for_department": "Acting",
+        })
+
+    @stub.route("/3/person/<int:person_id>/movie_credits")
+    def person_credits(person_id):
+        rng = random.Random(f"person:{person_id}")
+        return jsonify({
+            "id": person_id,
+            "cast": [
+                {**movie_item(rng.randint(1, 1_000_000)), "character": f"Character {i}"}
+                for i in range(cfg("cast_size"))
+            ],
+            "crew": [],
+        })
+
+    def changes_range():
+        """Parse start_date/end_date like TMDB (defaults to the last day, at most 14 days)"""
+        today = datetime.now(timezone.utc).date()
+        try:
+            end = date.fromisoformat(request.args.get("end_date", today.isoformat()))
+            start = date.fromisoformat(request.args.get("start_date", (end - timedelta(days=1)).isoformat()))
+        except ValueError:
+            abort(make_response({"status_code": 47, "status_message": "The input is not valid."}, 422))
+        if start > end or (end - start).days > 14:
+            abort(make_response({"status_code": 47, "status_message": "Invalid date range: Should be a range no longer than 14 days."}, 422))
+        return start, end
+
+    @stub.route("/3/movie/changes")
+    @stub.route("/3/person/changes")
+    def changes():
+        kind = request.path.split("/")[2]
+        start, end = changes_range()
+        ids = []
+        for day, day_changes in sorted(changed_ids[kind].items()):
+            if start <= date.fromisoformat(day) <= end:
+                ids.extend(i for i in day_changes if i not in ids)
+        page = request.args.get("page", 1, type=int)
+        per_page = 100
+        return jsonify({
+            "page": page,
+            "results": [{"id": i, "adult": False} for i in ids[(page - 1) * per_page:page * per_page]],
+            "total_pages": max(1, -(-len(ids) // per_page)),
+            "total_results": len(ids),
+        })
+
+    @stub.route("/3/movie/<int:item_id>/changes")
+    @stub.route("/3/person/<int:item_id>/changes")
+    def item_changes(item_id):
+        kind = request.path.split("/")[2]
+        start, end = changes_range()
+        times = [
+            day_changes[item_id] for day, day_changes in sorted(changed_ids[kind].items())
+            if start <= date.fromisoformat(day) <= end and item_id in day_changes
+        ]
+        return jsonify({"changes": [
+            {"key": "overview", "items": [
+                {"id": f"{kind}{item_id}x{n}", "action": "updated", "time": t, "iso_639_1": "en"}
+                for n, t in enumerate(times)
+            ]},
+        ] if times else []})
+
+    @stub.route("/__changes", methods=["POST"])
+    def set_changes():
+        """
+        Replace the changes of a feed: {"movie": {"2025-06-01": [603]}} or a list for today
+
+        Ids may also be given as {"id": 603, "time": "2025-06-01 10:00:00 UTC"}; the time
+        defaults to now for today and to noon for earlier days.
+        """
+        updates = request.get_json(silent=True) or {}
+        now = datetime.now(timezone.utc)
+        for kind in changed_ids:
+            if kind in updates:
+                by_day = updates[kind] if isinstance(updates[kind], dict) else {now.date().isoformat(): updates[kind]}
+                changed_ids[kind] = {}
+                for day, ids in by_day.items():
+                    day = date.fromisoformat(day).isoformat()
+                    default_time = (now.strftime("%Y-%m-%d %H:%M:%S") if day == now.date().isoformat()
+                                    else f"{day} 12:00:00") + " UTC"
+                    entries = [i if isinstance(i, dict) else {"id": i} for i in ids]
+                    changed_ids[kind][day] = {int(e["id"]): e.get("time", default_time) for e in entries}
+        return jsonify(changed_ids)
+
+    @stub.route("/__stats")
+    def get_stats():
+        with stats_lock:
+            return jsonify({**stats, "by_endpoint": dict(stats["by_endpoint"])})
+
+    @stub.route("/__reset", methods=["POST"])
+    def reset_stats():
+        with stats_lock:
+            stats.update(calls=0, errors=0, by_endpoint={})
+        return {"status": "ok"}
+
+    @stub.route("/__config", methods=["GET", "POST"])
+    def update_config():
+        if request.method == "POST":
+            updates = request.get_json(silent=True) or {}
+            unknown = set(updates) - set(DEFAULT_CONFIG)
+            if unknown:
+                return {"error": f"Unknown config keys: {sorted(unknown)}"}, 400
+            stub.config["STUB"].update(updates)
+        return jsonify(stub.config["STUB"])
+
+    return stub
+
+
+class _QuietRequestHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+class StubServer:
+    """Run the stub in a background thread (used by benchmark.py)"""
+
+    def __init__(self, host="127.0.0.1", port=0, config=None, quiet=True):
+        self.app = create_stub_app(config)
+        handler = _QuietRequestHandler if quiet else None
+        self._server = make_server(host, port, self.app, threaded=True, request_handler=handler)
+        self.host = host
+        self.port = self._server.server_port
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def api_base(self):
+        """Value to use for TMDB_API_BASE"""
+        return f"{self.base_url}/3"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def stop(self):
+        self._server.shutdown()
+        self._thread.join(timeout=5)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stub of the TMDB API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    for name, default in DEFAULT_CONFIG.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=type(default), default=default)
+    args = parser.parse_args()
+
+    config = {name: getattr(args, name) for name in DEFAULT_CONFIG}
+    server = StubServer(args.host, args.port, config, quiet=False)
+    print(f"[STUB] TMDB stub listening on {server.base_url} (TMDB_API_BASE={server.api_base})", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Opt-in traffic recording
+
+Writes one JSON line per sampled request (route, params, status, timing and
+cache outcome) so real traffic can be replayed with replay.py.
+
+Enabled by setting TRAFFIC_RECORD_FILE. Other settings:
+    TRAFFIC_SAMPLE_RATE   - fraction of requests recorded (default 1.0)
+    TRAFFIC_MAX_BYTES     - rotate the file at this size (default 50 MB)
+    TRAFFIC_BACKUP_COUNT  - rotated files to keep (default 5)
+
+With several gunicorn workers put "{pid}" in TRAFFIC_RECORD_FILE so each
+worker rotates its own file, e.g. traffic-{pid}.jsonl
+"""
+import json
+import logging
+import os
+import random
+import time
+from logging.handlers import RotatingFileHandler
+
+from flask import g, request
+
+from cache import get_cache_outcome
+
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024
+DEFAULT_BACKUP_COUNT = 5
+
+# Not worth replaying
+SKIPPED_PATHS = {"/", "/health"}
+
+
+def _build_logger(path, max_bytes, backup_count):
+    logger = logging.getLogger(f"traffic.{path}")
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    if not logger.handlers:
+        handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+    return logger
+
+
+def init_traffic_recording(app):
+    """Register the recording hooks on app if TRAFFIC_RECORD_FILE is set"""
+    path = os.environ.get("TRAFFIC_RECORD_FILE")
+    if not path:
+        return None
+
+    path = path.replace("{pid}", str(os.getpid()))
+    sample_rate = float(os.environ.get("TRAFFIC_SAMPLE_RATE", 1.0))
+    max_bytes = int(os.environ.get("TRAFFIC_MAX_BYTES", DEFAULT_MAX_BYTES))
+    backup_count = int(os.environ.get("TRAFFIC_BACKUP_COUNT", DEFAULT_BACKUP_COUNT))
+    logger = _build_logger(path, max_bytes, backup_count)
+
+    @app.before_request
+    def _start_recording():
+        g.traffic_sampled = request.path not in SKIPPED_PATHS and random.random() < sample_rate
+        g.traffic_started = time.perf_counter()
+        # Arrival time, so replay.py keeps the original request spacing
+        g.traffic_ts = time.time()
+
+    @app.after_request
+    def _record(response):
+        if not g.get("traffic_sampled"):
+            return response
+        record = {
+            "ts": round(g.traffic_ts, 3),
+            "method": request.method,
+            "route": request.url_rule.rule if request.url_rule else None,
+            "path": request.path,
+            "params": request.args.to_dict(flat=True),
+            "status": response.status_code,
+            "duration_ms": round((time.perf_counter() - g.traffic_started) * 1000.0, 2),
+            "cache": get_cache_outcome(),
+            "bytes": response.calculate_content_length(),
+        }
+        try:
+            logger.info(json.dumps(record, separators=(",", ":")))
+        except Exception as e:
+            print(f"[TRAFFIC] Failed to record request: {e}", flush=True)
+        return response
+
+    print(f"[TRAFFIC] Recording {sample_rate:.0%} of requests to '{path}'", flush=True)
+    return logger